@@ -9,6 +9,13 @@ it to make more informed decisions as the game progresses.
 """
 
 import random
+import threading
+from time import time
+import CchessEngine
+
+
+class _PonderStopped(Exception):
+    ''' Raised inside the search to abandon pondering when the opponent has moved '''
 
 class XiangqiAI:
     def __init__(self, depth):
@@ -100,39 +107,276 @@ class XiangqiAI:
         
         self.DEPTH = depth
         self.nextMove = None
+
+        # search state kept for the whole game, so each move starts from what the
+        # previous searches already learned instead of from scratch
+        self._EXACT, self._LOWERBOUND, self._UPPERBOUND = 0, 1, 2
+        self.transpositionTable = {}  # zobristKey: (depth, score, flag, bestMoveID, searchID)
+        self.maxTableSize = 500000
+        self.historyTable = {'R': {}, 'B': {}}  # moveID: bonus for quiet moves that caused a cutoff
+        self._searchID = 0  # advanced by every findBestMove, entries are tagged with it
+        self._rootDepth = depth
+        self.verbose = True  # print the thinking process, the benchmark switches it off
+        self.depthTimes = []  # seconds from the start of the last findBestMove to the end of each depth
+
+        # pondering: searching the expected reply on the opponent's time, see startPondering
+        self._ponderThread = None
+        self._ponderStop = threading.Event()
+        self._pondering = False
+        self._ponderMoveID = None  # the reply being pondered on
+        self._ponderKey = None  # zobristKey of the position after that reply
+        self._ponderHit = False  # the reply was played, the ponder search goes on as the real one
         
     def findRandomMove(self, validMoves):
         return validMoves[random.randint(0, len(validMoves) - 1)]
 
+    def notifyMove(self, move):
+        ''' Tell the AI a move was played on the board (by either side). If it is the reply being
+        pondered on, pondering keeps running and the next findBestMove waits for it instead of starting over '''
+        if self._ponderThread is not None and move.moveID == self._ponderMoveID:
+            self._ponderHit = True
+            return  # the tables are aged once the ponder thread is done with them, see __joinPonder
+        self.stopPondering()
+        self.__ageTables()
+
+    def __ageTables(self):
+        # the history bonus should mostly reflect the current position, so let the old values fade
+        for side in self.historyTable:
+            self.historyTable[side] = {moveID: bonus // 2 for moveID, bonus in self.historyTable[side].items() if bonus > 1}
+        if len(self.transpositionTable) > self.maxTableSize:
+            self.__pruneTable()
+
+    def __pruneTable(self):
+        ''' Drop the entries that were not written by the last two searches (pondering included),
+        what is left is mostly the subtree under the moves actually played '''
+        oldest = self._searchID - 1
+        self.transpositionTable = {key: entry for key, entry in self.transpositionTable.items() if entry[4] >= oldest}
+        if len(self.transpositionTable) > self.maxTableSize:
+            self.transpositionTable = {}
+
     def findBestMove(self, gs, validMoves):
+        # after a ponder hit the ponder search is already on this position, let it finish and reuse its table
+        self.__joinPonder(abandon=not self._ponderHit or gs.zobristKey != self._ponderKey)
+        self._searchID += 1
+        self._counter = 0
         random.shuffle(validMoves)
-        self.findMoveMiniMaxAlphaBeta(gs, validMoves, self.DEPTH, -self._CHECKMATE, self._CHECKMATE, 1 if gs.redToMove else -1)
-        print("No. of search for this move:",self._counter)
+        self.__iterativeDeepening(gs, validMoves)
+        if self.verbose:
+            print("No. of search for this move:",self._counter)
         return self.nextMove
 
+    def __iterativeDeepening(self, gs, validMoves):
+        ''' Search depth 1 to DEPTH, every depth fills the transposition table and leaves its best move in front '''
+        self.nextMove = None
+        if not self._pondering:
+            self.depthTimes = []
+        startTime = time()
+        for depth in range(1, self.DEPTH + 1):
+            self._rootDepth = depth
+            self.findMoveMiniMaxAlphaBeta(gs, validMoves, depth, -self._CHECKMATE, self._CHECKMATE, 1 if gs.redToMove else -1)
+            if self.nextMove is not None:
+                validMoves.remove(self.nextMove)
+                validMoves.insert(0, self.nextMove)
+            if not self._pondering:
+                self.depthTimes.append(time() - startTime)
+
+    def startPondering(self, gs):
+        ''' Call after the AI's own move: play the reply the last search expects on a copy of gs and
+        ponder (see below) on it in a background thread, until notifyMove with another move,
+        findBestMove or findBestMoves stops it '''
+        self.stopPondering()
+        gs = self.__copyState(gs)
+        entry = self.transpositionTable.get(gs.zobristKey)
+        if entry is None or entry[3] is None:
+            return
+        for move in gs.getValidMoves():
+            if move.moveID == entry[3]:
+                gs.makeMove(move)
+                break
+        else:
+            return
+        self._ponderMoveID = move.moveID
+        self._ponderKey = gs.zobristKey
+        self._ponderThread = threading.Thread(target=self.ponder, args=(gs,), daemon=True)
+        self._ponderThread.start()
+
+    def stopPondering(self):
+        self.__joinPonder(abandon=True)
+
+    def __joinPonder(self, abandon):
+        ''' Wait for the ponder thread to end, stopping it first if abandon '''
+        if self._ponderThread is not None:
+            if abandon:
+                self._ponderStop.set()
+            self._ponderThread.join()
+            self._ponderStop.clear()
+            self._ponderThread = None
+        if self._ponderHit:
+            self._ponderHit = False
+            self.__ageTables()  # skipped by notifyMove while the thread was still using the tables
+
+    def ponder(self, gs):
+        ''' Search gs, the position after the expected reply, to the full DEPTH.
+        A search from the new root two plies later can only reuse the shallow end of the previous
+        tree, this is what gives findBestMove a warm table when the opponent plays the expected reply.
+        gs is searched in place, so give it a copy if the game goes on meanwhile '''
+        self._pondering = True
+        try:
+            self.__iterativeDeepening(gs, gs.getValidMoves())
+        except _PonderStopped:
+            pass  # the entries already stored are complete, only the unfinished part is lost
+        finally:
+            self._pondering = False
+
+    def __copyState(self, gs):
+        copy = CchessEngine.GameState()
+        copy.loadFEN(gs.getFEN())
+        return copy
+
+    def findBestMoves(self, gs, validMoves, numMoves):
+        ''' Multi-PV: the numMoves best moves from a single search, best first.
+        Returns a list of (move, score, principal variation), the score is from the point of view of the
+        side to move. Every line shares the transposition and history tables of the normal search.
+        '''
+        if numMoves < 1:
+            raise ValueError("numMoves must be at least 1, got %d" % numMoves)
+        wasPondering = self._ponderThread is not None
+        self.stopPondering()
+        self._counter = 0
+        turnMultiplier = 1 if gs.redToMove else -1
+        rootMoves = list(validMoves)
+        random.shuffle(rootMoves)
+        ranked = []  # (score, move), best first, at most numMoves long
+        for depth in range(1, self.DEPTH + 1):
+            self._rootDepth = depth
+            ranked = []
+            for move in rootMoves:
+                # only a move that beats the current last line can enter the list, anything worse just
+                # has to be proved worse, which the window (-CHECKMATE, alpha] does cheaply
+                alpha = ranked[-1][0] if len(ranked) == numMoves else -self._CHECKMATE
+                gs.makeMove(move)
+                score = -self.findMoveMiniMaxAlphaBeta(gs, None, depth - 1, -self._CHECKMATE, -alpha, -turnMultiplier)
+                gs.undoMove()
+                if score > alpha or len(ranked) < numMoves:
+                    i = 0
+                    while i < len(ranked) and ranked[i][0] >= score:
+                        i += 1
+                    ranked.insert(i, (score, move))
+                    del ranked[numMoves:]
+            # search the best lines first at the next depth, they give the tightest alpha the soonest
+            bestMoves = [move for score, move in ranked]
+            rootMoves = bestMoves + [move for move in rootMoves if move not in bestMoves]
+        if self.verbose:
+            print("No. of search for these moves:",self._counter)
+
+        lines = []
+        for score, move in ranked:
+            gs.makeMove(move)
+            lines.append((move, score, [move] + self.__principalVariation(gs, self.DEPTH - 1)))
+            gs.undoMove()
+        if wasPondering:  # e.g. a hint asked for on the opponent's time, go back to pondering its reply
+            self.startPondering(gs)
+        return lines
+
+    def __principalVariation(self, gs, depth):
+        ''' Follow the best moves stored in the transposition table, at most depth moves '''
+        pv = []
+        for i in range(depth):
+            entry = self.transpositionTable.get(gs.zobristKey)
+            if entry is None or entry[3] is None:
+                break
+            move = None
+            for validMove in gs.getValidMoves():
+                if validMove.moveID == entry[3]:
+                    move = validMove
+            if move is None:
+                break
+            gs.makeMove(move)
+            pv.append(move)
+        for move in pv:
+            gs.undoMove()
+        return pv
+
     def findMoveMiniMaxAlphaBeta(self, gs, validMoves, depth, alpha, beta, turnMultiplier):
+        ''' Negamax with alpha-beta pruning, validMoves can be None and then is only generated
+        if the transposition table cannot answer for this position '''
         self._counter += 1
+        if self._pondering and self._ponderStop.is_set():
+            raise _PonderStopped()
+        isRoot = depth == self._rootDepth
+        alphaOrig = alpha
+        key = gs.zobristKey
+        hashMoveID = None
+        entry = self.transpositionTable.get(key)
+        if entry is not None:
+            hashMoveID = entry[3]
+            if entry[0] >= depth and not isRoot:  # the root always has to be searched to pick nextMove
+                if entry[2] == self._EXACT:
+                    return entry[1]
+                elif entry[2] == self._LOWERBOUND:
+                    alpha = max(alpha, entry[1])
+                else:
+                    beta = min(beta, entry[1])
+                if alpha >= beta:
+                    return entry[1]
+
+        if validMoves is None:
+            validMoves = gs.getValidMoves()  # create a subtree
         if depth == 0:  # back the root
-            return turnMultiplier * self.__scoreBoard(gs)
+            score = turnMultiplier * self.__scoreBoard(gs)
+            self.__storeEntry(key, 0, score, self._EXACT, None)
+            return score
 
+        self.__orderMoves(gs, validMoves, hashMoveID)
         maxScore = -self._CHECKMATE
+        bestMove = None
         for move in validMoves:  # loop every single valid move
             gs.makeMove(move)
-            nextMoves = gs.getValidMoves() # create a subtree
-            score = -self.findMoveMiniMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
+            score = -self.findMoveMiniMaxAlphaBeta(gs, None, depth - 1, -beta, -alpha, -turnMultiplier)
             if score > maxScore:
                 maxScore = score
-                if depth == self.DEPTH:
+                bestMove = move
+                if isRoot:
                     self.nextMove = move
-                    print(move, -score)  # print thh AI thinking process
+                    if depth == self.DEPTH and self.verbose and not self._pondering:
+                        print(move, -score)  # print thh AI thinking process
             gs.undoMove()
             
             if maxScore > alpha:
                 alpha = maxScore
             if alpha >= beta:  # pruning happen when alpha >= beta
+                if not move.isCapture:  # remember quiet moves that refute, they will be tried early next time
+                    history = self.historyTable['R' if gs.redToMove else 'B']
+                    history[move.moveID] = history.get(move.moveID, 0) + depth * depth
                 break
+
+        if maxScore <= alphaOrig:
+            flag = self._UPPERBOUND
+        elif maxScore >= beta:
+            flag = self._LOWERBOUND
+        else:
+            flag = self._EXACT
+        self.__storeEntry(key, depth, maxScore, flag, bestMove.moveID if bestMove is not None else None)
         return maxScore
 
+    def __storeEntry(self, key, depth, score, flag, bestMoveID):
+        ''' Keep the deeper result, only entries from before the previous search are always overwritten
+        (the previous search wrote the pondered subtree, which the first shallow iterations must not clobber) '''
+        entry = self.transpositionTable.get(key)
+        if entry is None or entry[0] <= depth or entry[4] < self._searchID - 1:
+            self.transpositionTable[key] = (depth, score, flag, bestMoveID, self._searchID)
+
+    def __orderMoves(self, gs, validMoves, hashMoveID):
+        ''' Sort in place: hash move, then captures (most valuable victim first), then history '''
+        history = self.historyTable['R' if gs.redToMove else 'B']
+        def moveOrder(move):
+            if move.moveID == hashMoveID:
+                return 1000000
+            if move.isCapture:
+                return 10000 + 10 * self.__pieceScore[move.pieceCaptured[1]] - self.__pieceScore[move.pieceMoved[1]]
+            return history.get(move.moveID, 0)
+        validMoves.sort(key=moveOrder, reverse=True)  # stable, so equal moves keep the shuffled order
+
     def __scoreBoard(self, gs):
         if gs.checkMate:
             if gs.redToMove:
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This is the search benchmark. It runs XiangqiAI.findBestMove on a fixed set of
+opening, middlegame, tactical and endgame positions, reports time-to-depth, nodes,
+NPS and the best move for each of them, and compares the run against a stored
+baseline so engine changes can be judged by numbers. Node counts are repeatable
+on any machine, so they decide pass/fail; times depend on the machine and are
+only reported, unless --time-threshold asks for a time gate as well (only
+meaningful against a baseline recorded on the same machine).
+
+Usage:
+    python3 CchessBenchmark.py                  # run and compare against benchmark_baseline.json
+    python3 CchessBenchmark.py --save           # run and store the result as the new baseline
+    python3 CchessBenchmark.py --category endgame --depth 2
+    python3 CchessBenchmark.py --time-threshold 0.10   # also fail when the run is more than 10% slower
+"""
+
+from time import time
+import argparse
+import json
+import os
+import random
+import sys
+import CchessEngine
+import CchessAI
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_DEPTH = 3
+DEFAULT_THRESHOLD = 0.15  # fail when the run searches more than 15% more nodes than the baseline
+
+# (name, category, FEN) - keep this list fixed, otherwise old baselines are no longer comparable
+BENCHMARK_POSITIONS = [
+    ("start", "opening", "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w"),
+    ("central-cannon", "opening", "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C2C4/9/RNBAKABNR b"),
+    ("screen-horses", "opening", "r1bakabnr/9/1cn4c1/p1p1p1p1p/9/9/P1P1P1P1P/1C2C1N2/9/RNBAKAB1R b"),
+    ("developed", "middlegame", "2bak1br1/4a4/1r2c1nc1/p3p1p1p/2p6/P7P/2P1P1P2/2N1C1N2/4A4/R1BAK1B1R w"),
+    ("horse-raid", "middlegame", "3ak1br1/4a4/1r2b1Nc1/4p1p1p/2p6/p7P/2P3P2/4C1N2/4A4/R1BAK1BR1 w"),
+    ("rook-on-rib", "middlegame", "1rbak1b1r/4a3n/2c5c/6R2/p1p5p/6P2/P1P1P3P/2N1C1N2/4A4/R1BAK1B2 w"),
+    ("cannons-inside", "middlegame", "1r2kab2/1c2a4/2n1bc3/4p1pr1/N7p/2P3P2/P3P3P/4C1N2/R3A4/2BAK1B1R w"),
+    ("chariot-mate-in-1", "tactical", "3k5/R8/9/9/r8/8R/9/9/9/4K4 w"),
+    ("cannon-behind-lines", "tactical", "1rbak1b1r/4a3n/9/6R2/2p5p/p4NP2/P1c1P4/B1N1C4/R8/3AKAB1c w"),
+    ("loose-pieces", "tactical", "1r2kab2/4a4/4b4/n1P1N1pr1/4c4/P4NP1R/9/2c1C4/R3A4/2BAK1B2 w"),
+    ("chariot-vs-advisors", "endgame", "3aka3/9/9/9/9/5R3/9/9/9/3K5 w"),
+    ("horse-soldier-vs-advisor", "endgame", "4k4/4a4/9/9/4P4/9/9/5N3/9/3K5 w"),
+    ("cannon-vs-elephant", "endgame", "4k4/9/2b6/9/2p6/9/9/4C4/4A4/3AK4 w"),
+]
+
+
+def runPosition(fen, depth):
+    ''' Search one position with a fresh AI and return its statistics '''
+    gs = CchessEngine.GameState()
+    gs.loadFEN(fen)
+    validMoves = gs.getValidMoves()
+    random.seed(0)  # findBestMove shuffles the root moves, a fixed seed keeps the node count repeatable
+    AI = CchessAI.XiangqiAI(depth)
+    AI.verbose = False
+    t1 = time()
+    bestMove = AI.findBestMove(gs, validMoves)
+    t2 = time()
+    seconds = t2 - t1
+    return {"seconds": round(seconds, 4),
+            "depthSeconds": [round(depthTime, 4) for depthTime in AI.depthTimes],
+            "nodes": AI._counter,
+            "nps": round(AI._counter / seconds) if seconds > 0 else 0,
+            "bestMove": str(bestMove)}
+
+
+def runBenchmark(depth, category=None):
+    ''' Run every position (or those of one category) and print a line for each '''
+    results = {}
+    print("%-26s %-11s %9s %9s %9s  %-14s %s" % ("position", "category", "seconds", "nodes", "nps", "best move",
+                                                 "time to depth 1, 2, ..."))
+    for name, positionCategory, fen in BENCHMARK_POSITIONS:
+        if category is not None and positionCategory != category:
+            continue
+        result = runPosition(fen, depth)
+        results[name] = result
+        print("%-26s %-11s %9.2f %9d %9d  %-14s %s" % (name, positionCategory, result["seconds"], result["nodes"],
+                                                       result["nps"], result["bestMove"],
+                                                       " ".join("%.3f" % t for t in result["depthSeconds"])))
+    totalSeconds = sum(result["seconds"] for result in results.values())
+    totalNodes = sum(result["nodes"] for result in results.values())
+    print("%-38s %9.2f %9d %9d" % ("total", totalSeconds, totalNodes, totalNodes / totalSeconds if totalSeconds > 0 else 0))
+    return results
+
+
+def compareWithBaseline(results, baseline, threshold, timeThreshold=None):
+    ''' Compare a run with the baseline, return True when it is within the threshold
+    (and within timeThreshold of the baseline's time, if one is given) '''
+    baseResults = baseline["positions"]
+    common = [name for name in results if name in baseResults]
+    if not common:
+        print("No positions in common with the baseline, nothing to compare")
+        return True
+
+    print()
+    print("%-26s %12s %12s  %s" % ("position", "time ratio", "node ratio", "best move"))
+    for name in common:
+        new, old = results[name], baseResults[name]
+        timeRatio = new["seconds"] / old["seconds"] if old["seconds"] > 0 else 1.0
+        nodeRatio = new["nodes"] / old["nodes"] if old["nodes"] > 0 else 1.0
+        moveNote = "same" if new["bestMove"] == old["bestMove"] else "changed (was %s)" % old["bestMove"]
+        print("%-26s %12.2f %12.2f  %s" % (name, timeRatio, nodeRatio, moveNote))
+
+    # the total node count decides pass/fail: it is the same on every machine, while the seconds
+    # in the baseline are from whoever recorded it, so time only counts when asked for
+    newSeconds = sum(results[name]["seconds"] for name in common)
+    oldSeconds = sum(baseResults[name]["seconds"] for name in common)
+    newNodes = sum(results[name]["nodes"] for name in common)
+    oldNodes = sum(baseResults[name]["nodes"] for name in common)
+    timeRatio = newSeconds / oldSeconds if oldSeconds > 0 else 1.0
+    nodeRatio = newNodes / oldNodes if oldNodes > 0 else 1.0
+    print("%-26s %12.2f %12.2f" % ("total", timeRatio, nodeRatio))
+
+    passed = nodeRatio <= 1 + threshold
+    if timeThreshold is None:
+        print("%s (node threshold %d%%, time is for information only)" % ("PASS" if passed else "FAIL", round(threshold * 100)))
+        return passed
+    timePassed = timeRatio <= 1 + timeThreshold
+    print("%s (node threshold %d%%: %s, time threshold %d%%: %s)" % ("PASS" if passed and timePassed else "FAIL",
+                                                                   round(threshold * 100), "pass" if passed else "fail",
+                                                                   round(timeThreshold * 100), "pass" if timePassed else "fail"))
+    return passed and timePassed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Chinese chess AI search")
+    parser.add_argument("--depth", type=int, default=None,
+                        help="search depth (default: the baseline's depth, or %d)" % DEFAULT_DEPTH)
+    parser.add_argument("--category", choices=["opening", "middlegame", "tactical", "endgame"],
+                        help="only run the positions of one category")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed growth of the node count before the run fails, as a fraction (default %.2f)" % DEFAULT_THRESHOLD)
+    parser.add_argument("--time-threshold", type=float, default=None,
+                        help="also fail when the total time grows by more than this fraction; only use it "
+                             "with a baseline recorded on this machine (default: time is not checked)")
+    parser.add_argument("--save", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    depth = args.depth
+    if depth is None:
+        depth = baseline["depth"] if baseline is not None else DEFAULT_DEPTH
+
+    results = runBenchmark(depth, args.category)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"depth": depth, "positions": results}, f, indent=2)
+            f.write("\n")
+        print("Baseline saved to", args.baseline)
+        return 0
+    if baseline is None:
+        print("No baseline found, run with --save to create one")
+        return 0
+    if baseline["depth"] != depth:
+        print("Baseline was recorded at depth %d, not comparing with a depth %d run" % (baseline["depth"], depth))
+        return 0
+    return 0 if compareWithBaseline(results, baseline, args.threshold, args.time_threshold) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,21 @@ of a Chinese chess game. It will also be responsible for determining the valid
 moves at the current state. It will also keep a move log.
 """
 
+import random
+
+# Zobrist keys: one random 64-bit number for every piece on every square, plus one
+# for the side to move. XOR-ing them together gives a hash of the position that can
+# be updated incrementally in makeMove/undoMove.
+_zobristRandom = random.Random(20240101)  # fixed seed so keys are the same every run
+ZOBRIST_PIECES = {piece: [[_zobristRandom.getrandbits(64) for c in range(9)] for r in range(10)]
+                  for piece in ['BR', 'BH', 'BE', 'BA', 'BK', 'BC', 'BS', 'RR', 'RH', 'RE', 'RA', 'RK', 'RC', 'RS']}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+
+# FEN letters for the piece types, red is upper case and black is lower case
+PIECE_TO_FEN = {'R': 'R', 'H': 'N', 'E': 'B', 'A': 'A', 'K': 'K', 'C': 'C', 'S': 'P'}
+FEN_TO_PIECE = {v: k for k,v in PIECE_TO_FEN.items()}
+FEN_TO_PIECE.update({'H': 'H', 'E': 'E', 'S': 'S'})
+
 class GameState:
     def __init__(self):
         # board is an 10x9 2D list, each element of the list has 2 characters
@@ -33,13 +48,83 @@ class GameState:
         self.redToMove = True
         self.checkMate = False
         self.staleMate = False
+        self.zobristKey = self.computeZobristKey()
+
+    def computeZobristKey(self):
+        ''' Hash the whole board from scratch, makeMove/undoMove keep it up to date afterwards '''
+        key = 0 if self.redToMove else ZOBRIST_BLACK_TO_MOVE
+        for r in range(len(self.board)):
+            for c in range(len(self.board[r])):
+                if self.board[r][c] != "--":
+                    key ^= ZOBRIST_PIECES[self.board[r][c]][r][c]
+        return key
         
+    def loadFEN(self, fen):
+        ''' Set up the board from a FEN string, e.g. "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w"
+        Upper case is red, lower case is black, both 'n'/'h' (horse), 'b'/'e' (elephant) and 'p'/'s' (soldier) are accepted
+        '''
+        fields = fen.split()
+        board = []
+        for rank in fields[0].split('/'):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                elif char.upper() in FEN_TO_PIECE:
+                    row.append(('R' if char.isupper() else 'B') + FEN_TO_PIECE[char.upper()])
+                else:
+                    raise ValueError("Invalid FEN piece: " + char)
+            if len(row) != 9:
+                raise ValueError("Invalid FEN rank: " + rank)
+            board.append(row)
+        if len(board) != 10:
+            raise ValueError("Invalid FEN, expected 10 ranks: " + fen)
+
+        redKingLocation, blackKingLocation = None, None
+        for r in range(10):
+            for c in range(9):
+                if board[r][c] == "RK":
+                    redKingLocation = (r, c)
+                elif board[r][c] == "BK":
+                    blackKingLocation = (r, c)
+        if redKingLocation is None or blackKingLocation is None:
+            raise ValueError("Invalid FEN, both kings are needed: " + fen)
+
+        self.board = board
+        self.redToMove = len(fields) < 2 or fields[1] in ('w', 'r')
+        self.__moveLog = []
+        self.__redKingLocation = redKingLocation
+        self.__blackKingLocation = blackKingLocation
+        self.checkMate = False
+        self.staleMate = False
+        self.zobristKey = self.computeZobristKey()
+
+    def getFEN(self):
+        ''' The current position as a FEN string, the reverse of loadFEN '''
+        ranks = []
+        for row in self.board:
+            rank, empty = "", 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                char = PIECE_TO_FEN[square[1]]
+                rank += char if square[0] == 'R' else char.lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        return "/".join(ranks) + (" w" if self.redToMove else " b")
+
     def makeMove(self, move):
         ''' Takes a Move as a parameter and excutes it '''
         self.board[move._startRow][move._startCol] = "--"
         self.board[move._endRow][move._endCol] = move.pieceMoved
         self.__moveLog.append(move) # log the move 
         self.redToMove = not self.redToMove # swap player
+        self.zobristKey ^= self.__zobristDelta(move)
         # update the king's location if moved
         if move.pieceMoved == "RK":
             self.__redKingLocation = (move._endRow, move._endCol)
@@ -53,12 +138,21 @@ class GameState:
             self.board[move._startRow][move._startCol] = move.pieceMoved
             self.board[move._endRow][move._endCol] = move.pieceCaptured
             self.redToMove = not self.redToMove # switch turns back
+            self.zobristKey ^= self.__zobristDelta(move)
             # update the king's location if needed
             if move.pieceMoved == "RK":
                 self.__redKingLocation = (move._startRow, move._startCol)
             elif move.pieceMoved == "BK":
                 self.__blackKingLocation = (move._startRow, move._startCol)
 
+    def __zobristDelta(self, move):
+        ''' The XOR difference a move makes to the hash, the same value undoes it '''
+        delta = ZOBRIST_PIECES[move.pieceMoved][move._startRow][move._startCol] ^ \
+                ZOBRIST_PIECES[move.pieceMoved][move._endRow][move._endCol] ^ ZOBRIST_BLACK_TO_MOVE
+        if move.isCapture:
+            delta ^= ZOBRIST_PIECES[move.pieceCaptured][move._endRow][move._endCol]
+        return delta
+
     def getValidMoves(self):
         ''' All moves considering checks '''
         #1.) generate all possible moves
@@ -94,6 +188,10 @@ class GameState:
                     self.__moveFunctions[piece](r, c, moves) # calls the appropriate move function based on piece type 
         return moves
     
+    def inCheck(self):
+        ''' Determine if the player to move is in check '''
+        return self.__inCheck()
+
     def __inCheck(self):
         ''' Determine if the current player is in check '''
         if not self.faceToFace():
@@ -68,6 +68,8 @@ def gameLoop(p, screen, playerOne, playerTwo, depth):
     gs = CchessEngine.GameState()
     validMoves = gs.getValidMoves()
     loadImages() # only do this once, before the while loop
+    # one AI for the whole game, it keeps its search tables between moves
+    AI = CchessAI.XiangqiAI(depth) if depth is not None else None
     
     gameRound = 0
     sqSelected = () # no square is selected, keep track of the last click of the user (row, col)
@@ -99,6 +101,8 @@ def gameLoop(p, screen, playerOne, playerTwo, depth):
                         for i in range(len(validMoves)):
                             if move == validMoves[i]:
                                 gs.makeMove(move)
+                                if AI is not None:
+                                    AI.notifyMove(move)
                                 print(move) # debugggg
                                 moveMade = True
                                 sqSelected = () # reset user clicks
@@ -114,11 +118,16 @@ def gameLoop(p, screen, playerOne, playerTwo, depth):
                     gameOver = False
                     gameRound -= 2
                 if e.key == p.K_r:  # reset the board when 'r' is pressed
+                    if AI is not None:
+                        AI.stopPondering()
                     main()
+                if e.key == p.K_h and AI is not None and humanTurn and not gameOver:  # hint when 'h' is pressed
+                    print("Hints:")
+                    for move, score, pv in AI.findBestMoves(gs, validMoves, 3):
+                        print(move, score, "line:", ", ".join(str(m) for m in pv))
                 
         # AI move finder
         if not gameOver and not humanTurn:
-            AI = CchessAI.XiangqiAI(depth)
             t1 = time()
             AIMove = AI.findBestMove(gs, validMoves)
             print("The AI move is:",AIMove)
@@ -128,6 +137,8 @@ def gameLoop(p, screen, playerOne, playerTwo, depth):
             if AIMove is None:
                 AIMove = AI.findRandomMove(validMoves)
             gs.makeMove(AIMove)
+            AI.notifyMove(AIMove)
+            AI.startPondering(gs)  # think about the expected reply while the human is thinking
             moveMade = True
         
         if moveMade:
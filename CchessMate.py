@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This class is responsible for solving forced mates (checkmate puzzles). It uses
+depth-first proof-number search (df-pn) on top of GameState: the attacker may only
+play checking moves, the defender may play every legal move, and the search keeps
+growing the part of the tree that is closest to being proved or disproved. The
+node table is bounded in size, and a solved position gives back the mating line
+together with the distance to mate.
+
+Usage:
+    python3 CchessMate.py "<FEN>" ["<FEN>" ...]
+    python3 CchessMate.py --file puzzles.txt     # one FEN per line
+"""
+
+from time import time
+import argparse
+import sys
+import CchessEngine
+
+INFINITY = 10 ** 9
+
+
+class MateSolver:
+    def __init__(self, maxNodes=2000000, maxTableSize=200000):
+        self.maxNodes = maxNodes  # search effort, one solve call gives up after this many node visits in total
+        self.maxTableSize = maxTableSize  # node table bound, the smallest subtrees are dropped when it is full
+        self._EPSILON = 0.25  # 1+epsilon trick, lets a child search a bit longer before switching to a sibling
+        # tableKey: [phi, delta, distance, work, moves, childKeys, repetitions]
+        # tableKey is the zobristKey, or (zobristKey, plies left) when the search has a ply limit
+        # repetitions: for a disproof that relied on repeating positions of the search path, those
+        # positions; the disproof only holds while they are all on the path again
+        self._table = {}
+        self._path = set()  # positions on the current search path, repeating one means the checks go round in circles
+        self._attackerIsRed = True
+        self._nodes = 0
+
+    def solve(self, gs, maxPlies=None, shortest=True):
+        ''' Look for a forced mate for the side to move, within maxPlies plies if given.
+        With shortest, the ply limit is tightened until it is proved that no quicker mate is left.
+        Returns (mating line, distance to mate in plies, exact):
+        - exact is True when the distance is proved to be the shortest mate, False when it is only
+          an upper bound (shortest is off, or a tighter search ran out of maxNodes)
+        - without a mate the line and distance are None, exact is True when there is proved to be
+          no mate and False when the search ran out of maxNodes
+        '''
+        self._attackerIsRed = gs.redToMove
+        self._nodes = 0
+        bestLine = None
+        while True:
+            line, exhausted = self.__proveMate(gs, maxPlies)
+            if line is not None and not self.__isMateLine(gs, line):
+                # the proof could not be followed to a mate (e.g. parts of it were dropped from the table
+                # and maxNodes ran out re-proving them), so this search proved nothing
+                line, exhausted = None, True
+            if line is None:
+                # a disproved tighter bound makes the last line the shortest, running out of nodes proves nothing
+                return bestLine, None if bestLine is None else len(bestLine), not exhausted
+            bestLine = line
+            if len(line) == 1:
+                return line, 1, True
+            if not shortest:
+                return line, len(line), False
+            maxPlies = len(line) - 2  # mates always end on an attacker's move, so look for one two plies shorter
+
+    def __proveMate(self, gs, maxPlies):
+        ''' One df-pn search from the root, within what is left of maxNodes.
+        Returns (mating line, False) if proved, (None, False) if disproved and (None, True) if maxNodes ran out '''
+        self._table = {}
+        self._path = set()
+        self.__mid(gs, maxPlies, INFINITY, INFINITY)
+        entry = self._table.get(self.__tableKey(gs.zobristKey, maxPlies))
+        if entry is not None and entry[0] == 0:  # root is an OR node, phi == 0 means proved
+            line = self.__mateLine(gs, maxPlies)
+            return line, line is None
+        return None, entry is None or entry[1] != 0  # delta == 0 means disproved
+
+    def __isMateLine(self, gs, line):
+        ''' Replay the line: legal moves, every attacker move gives check and the defender ends without a move '''
+        played = 0
+        isMate = len(line) % 2 == 1
+        for i in range(len(line)):
+            if not isMate:
+                break
+            if line[i] not in gs.getValidMoves():
+                isMate = False
+                break
+            gs.makeMove(line[i])
+            played += 1
+            if i % 2 == 0 and not gs.inCheck():
+                isMate = False
+        if isMate:
+            isMate = len(gs.getValidMoves()) == 0
+        for i in range(played):
+            gs.undoMove()
+        return isMate
+
+    def __tableKey(self, zobristKey, pliesLeft):
+        return zobristKey if pliesLeft is None else (zobristKey, pliesLeft)
+
+    def __isOrNode(self, gs):
+        ''' OR nodes are the attacker's turn, one checking move that mates is enough '''
+        return gs.redToMove == self._attackerIsRed
+
+    def __isMated(self, entry, isOr):
+        ''' The node is proved to be a mate for the attacker '''
+        return entry is not None and ((isOr and entry[0] == 0) or (not isOr and entry[1] == 0))
+
+    def __isEscaped(self, entry, isOr):
+        ''' The node is proved not to be a mate for the attacker '''
+        return entry is not None and ((isOr and entry[1] == 0) or (not isOr and entry[0] == 0))
+
+    def __holdsOnPath(self, entry):
+        ''' A disproof from repetitions only holds when the repeated positions are on the current path '''
+        return entry[6] is None or entry[6] <= self._path
+
+    def __childPlies(self, pliesLeft):
+        return None if pliesLeft is None else pliesLeft - 1
+
+    def __expand(self, gs, pliesLeft):
+        ''' Find the node in the table, or create it with its moves.
+        phi/delta are the proof/disproof numbers seen from the side to move:
+        OR node phi = proof number, delta = disproof number, AND node the other way round
+        '''
+        key = self.__tableKey(gs.zobristKey, pliesLeft)
+        entry = self._table.get(key)
+        if entry is not None:
+            return entry
+
+        isOr = self.__isOrNode(gs)
+        if isOr and pliesLeft is not None and pliesLeft < 1:
+            moves = []  # no time left for another check
+        else:
+            moves = gs.getValidMoves()
+            if isOr:
+                moves = [move for move in moves if self.__givesCheck(gs, move)]
+        childKeys = []
+        for move in moves:
+            gs.makeMove(move)
+            childKeys.append(gs.zobristKey)
+            gs.undoMove()
+
+        # an AND node needs every reply refuted, so its proof number starts at the number of replies
+        entry = [1, 1 if isOr else len(moves), None, 0, moves, childKeys, None]
+        if len(moves) == 0:
+            # the side to move has lost: the attacker has no check left, or the defender is mated
+            # (in Chinese chess having no legal move loses, in check or not)
+            entry[0], entry[1], entry[2] = INFINITY, 0, 0
+        elif not isOr and pliesLeft == 0:
+            entry[0], entry[1], entry[4], entry[5] = 0, INFINITY, [], []  # the defender survived the ply limit
+        self.__store(key, entry)
+
+        if isOr:
+            # expand the replies to every check straight away, this finds mates in one and
+            # gives the checks their proof numbers before the first one is chosen
+            for move in moves:
+                gs.makeMove(move)
+                self.__expand(gs, self.__childPlies(pliesLeft))
+                gs.undoMove()
+        return entry
+
+    def __givesCheck(self, gs, move):
+        gs.makeMove(move)
+        check = gs.inCheck()
+        gs.undoMove()
+        return check
+
+    def __childValues(self, childKey, childPlies, childIsOr):
+        ''' (phi, delta, repetitions) of a child, phi and delta seen from the child's side to move '''
+        if childKey in self._path:
+            # a repetition never mates: the attacker is the one who fails, but only along this path
+            return ((INFINITY, 0) if childIsOr else (0, INFINITY)) + (frozenset([childKey]),)
+        entry = self._table.get(self.__tableKey(childKey, childPlies))
+        if entry is None or (self.__isEscaped(entry, childIsOr) and not self.__holdsOnPath(entry)):
+            return 1, 1, None
+        return entry[0], entry[1], entry[6]
+
+    def __mid(self, gs, pliesLeft, thresholdPhi, thresholdDelta):
+        ''' Multiple iterative deepening: search the node until phi or delta reaches its threshold '''
+        self._nodes += 1
+        entry = self.__expand(gs, pliesLeft)
+        isOr = self.__isOrNode(gs)
+        if self.__isEscaped(entry, isOr) and not self.__holdsOnPath(entry):
+            entry[6] = None  # disproved along another path, search it again from this one
+        elif entry[0] == 0 or entry[1] == 0:  # already proved or disproved
+            return
+
+        moves, childKeys = entry[4], entry[5]
+        childPlies = self.__childPlies(pliesLeft)
+        nodesBefore = self._nodes
+        self._path.add(gs.zobristKey)
+        while True:
+            # phi = the smallest delta of the children, delta = the sum of the children's phi
+            delta = 0
+            best, bestPhi, bestDelta, secondDelta = 0, INFINITY, INFINITY, INFINITY
+            repetitions = set()
+            for i in range(len(childKeys)):
+                childPhi, childDelta, childRepetitions = self.__childValues(childKeys[i], childPlies, not isOr)
+                if childRepetitions is not None:
+                    repetitions |= childRepetitions
+                delta = min(INFINITY, delta + childPhi)
+                if childDelta < bestDelta:
+                    best, bestPhi, secondDelta, bestDelta = i, childPhi, bestDelta, childDelta
+                elif childDelta < secondDelta:
+                    secondDelta = childDelta
+            phi = bestDelta
+            entry[0], entry[1] = phi, delta
+            if phi >= thresholdPhi or delta >= thresholdDelta or self._nodes >= self.maxNodes:
+                break
+
+            childThresholdPhi = min(INFINITY, thresholdDelta - (delta - bestPhi))
+            childThresholdDelta = min(thresholdPhi, int(secondDelta * (1 + self._EPSILON)) + 1)
+            gs.makeMove(moves[best])
+            self.__mid(gs, childPlies, childThresholdPhi, childThresholdDelta)
+            gs.undoMove()
+        self._path.discard(gs.zobristKey)
+
+        entry[3] += self._nodes - nodesBefore
+        repetitions.discard(gs.zobristKey)  # coming back to this very position is no way out from it
+        entry[6] = frozenset(repetitions) if self.__isEscaped(entry, isOr) and repetitions else None
+        if self.__isMated(entry, isOr):
+            entry[2] = self.__provedDistance(childKeys, childPlies, isOr)
+        # the entry may have been dropped from the table while searching below it
+        self.__store(self.__tableKey(gs.zobristKey, pliesLeft), entry)
+
+    def __provedDistance(self, childKeys, childPlies, isOr):
+        ''' Plies to mate of a proved node: the attacker takes the quickest proved check,
+        the defender the longest resistance. None if a child's distance is not known (anymore) '''
+        distances = []
+        for childKey in childKeys:
+            entry = self._table.get(self.__tableKey(childKey, childPlies))
+            if self.__isMated(entry, not isOr) and entry[2] is not None:
+                distances.append(entry[2])
+            elif not isOr:
+                return None
+        if len(distances) == 0:
+            return None
+        return 1 + (min(distances) if isOr else max(distances))
+
+    def __store(self, key, entry):
+        if len(self._table) >= self.maxTableSize and key not in self._table:
+            # keep the half of the table that took the most work to build, the rest is cheap to search again
+            # (done before storing, so the entry being stored is always kept)
+            keep = sorted(self._table.items(), key=lambda item: item[1][3], reverse=True)[:self.maxTableSize // 2]
+            self._table = dict(keep)
+        self._table[key] = entry
+
+    def __distance(self, gs, pliesLeft, path):
+        ''' Plies to mate of a proved position, proving it again if it was dropped from the table.
+        None if it is not a mate (within the path, or within maxNodes) '''
+        key = self.__tableKey(gs.zobristKey, pliesLeft)
+        isOr = self.__isOrNode(gs)
+        entry = self._table.get(key)
+        if not self.__isMated(entry, isOr):
+            if self._nodes >= self.maxNodes:
+                return None
+            self.__mid(gs, pliesLeft, INFINITY, INFINITY)  # uses what is left of the same maxNodes
+            entry = self._table.get(key)
+            if not self.__isMated(entry, isOr):
+                return None
+        if entry[2] is not None:
+            return entry[2]
+
+        childPlies = self.__childPlies(pliesLeft)
+        path.add(key)  # table keys: with a ply limit the same position further down is a different node
+        distances = []
+        for i in self.__candidates(entry, childPlies, isOr):
+            if self.__tableKey(entry[5][i], childPlies) in path:
+                continue
+            gs.makeMove(entry[4][i])
+            distance = self.__distance(gs, childPlies, path)
+            gs.undoMove()
+            if distance is not None:
+                distances.append(distance)
+        path.discard(key)
+        if len(distances) == 0:
+            return None
+        entry[2] = 1 + (min(distances) if isOr else max(distances))
+        self.__store(key, entry)
+        return entry[2]
+
+    def __candidates(self, entry, childPlies, isOr):
+        ''' Indexes of the children that can continue a proved line: every reply of the defender, and the
+        checks already proved to mate, or all checks if none of those are left in the table '''
+        candidates = range(len(entry[5]))
+        if isOr:
+            candidates = [i for i in candidates
+                          if self.__isMated(self._table.get(self.__tableKey(entry[5][i], childPlies)), False)] or candidates
+        return candidates
+
+    def __mateLine(self, gs, pliesLeft):
+        ''' Follow the proof from the root: the attacker's quickest proved mate against the longest defence,
+        so the length of the line is the distance to mate. None if the proof cannot be followed to the end '''
+        line = []
+        played = []  # kept apart from line, which becomes None on failure
+        path = set()
+        while True:
+            entry = self.__expand(gs, pliesLeft)
+            moves, childKeys = entry[4], entry[5]
+            isOr = self.__isOrNode(gs)
+            if len(moves) == 0:
+                if not isOr and entry[1] == 0:  # defender is mated
+                    break
+                line = None  # attacker out of checks, or defender survived the ply limit
+                break
+            childPlies = self.__childPlies(pliesLeft)
+            path.add(self.__tableKey(gs.zobristKey, pliesLeft))
+            choice, choiceDistance = None, None
+            for i in self.__candidates(entry, childPlies, isOr):
+                if self.__tableKey(childKeys[i], childPlies) in path:
+                    continue
+                gs.makeMove(moves[i])
+                distance = self.__distance(gs, childPlies, set(path))
+                gs.undoMove()
+                if distance is None:
+                    continue
+                if choice is None or (distance < choiceDistance if isOr else distance > choiceDistance):
+                    choice, choiceDistance = i, distance
+            if choice is None:  # no child could be proved again, e.g. maxNodes ran out
+                line = None
+                break
+            line.append(moves[choice])
+            gs.makeMove(moves[choice])
+            played.append(moves[choice])
+            pliesLeft = childPlies
+        for move in played:
+            gs.undoMove()
+        return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve Chinese chess forced mates with proof-number search")
+    parser.add_argument("fens", nargs="*", help="positions to solve, the side to move is the attacker")
+    parser.add_argument("--file", help="file with one FEN per line")
+    parser.add_argument("--max-nodes", type=int, default=2000000, help="search effort per position")
+    args = parser.parse_args()
+
+    fens = list(args.fens)
+    if args.file:
+        with open(args.file) as f:
+            fens += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    solver = MateSolver(maxNodes=args.max_nodes)
+    unsolved = 0
+    for fen in fens:
+        gs = CchessEngine.GameState()
+        gs.loadFEN(fen)
+        t1 = time()
+        line, distance, exact = solver.solve(gs)
+        t2 = time()
+        if line is None:
+            unsolved += 1
+            print("%s  %s (%d nodes, %.2fs)" % (fen, "no mate" if exact else "no mate found within --max-nodes",
+                  solver._nodes, t2 - t1))
+        else:
+            print("%s  mate in %s%d (%d plies): %s  (%d nodes, %.2fs)" % (fen, "" if exact else "at most ",
+                  (distance + 1) // 2, distance,
+                  ", ".join(str(move) for move in line), solver._nodes, t2 - t1))
+    return 1 if unsolved else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the mate solver. Run with: python3 -m unittest test_CchessMate
+"""
+
+import unittest
+import CchessEngine
+import CchessMate
+
+ROOK_MATE = "1N7/5k3/9/9/9/9/4p4/9/4K2R1/7R1 w"  # mate in 7 plies
+LONG_MATE = "2b1k4/9/5a3/2R2N3/1P7/9/3p5/5K3/9/3C5 w"  # mate in 21 plies
+
+
+def loadGame(fen):
+    gs = CchessEngine.GameState()
+    gs.loadFEN(fen)
+    return gs
+
+
+class MateSolverTest(unittest.TestCase):
+
+    def assertMateLine(self, fen, line):
+        ''' The line must alternate checking moves and replies and leave the defender without moves '''
+        gs = loadGame(fen)
+        self.assertEqual(len(line) % 2, 1)
+        for ply, move in enumerate(line):
+            self.assertIn(move, gs.getValidMoves())
+            gs.makeMove(move)
+            if ply % 2 == 0:
+                self.assertTrue(gs.inCheck())
+        self.assertEqual(gs.getValidMoves(), [])
+
+    def testFindsShortestMate(self):
+        gs = loadGame(ROOK_MATE)
+        line, distance, exact = CchessMate.MateSolver().solve(gs)
+        self.assertEqual((distance, exact), (7, True))
+        self.assertMateLine(ROOK_MATE, line)
+        self.assertEqual(gs.getFEN(), ROOK_MATE)
+
+    def testTinyTableStaysWithinBudget(self):
+        # with a table this small entries are evicted all the time, the solver must not answer
+        # with a broken line or a wrong "no mate", and must stop at maxNodes
+        for fen in (ROOK_MATE, LONG_MATE):
+            for maxTableSize in (20, 40, 200):
+                solver = CchessMate.MateSolver(maxNodes=3000, maxTableSize=maxTableSize)
+                gs = loadGame(fen)
+                line, distance, exact = solver.solve(gs)
+                self.assertLessEqual(solver._nodes, solver.maxNodes)
+                self.assertEqual(gs.getFEN(), fen)
+                if line is None:
+                    self.assertEqual((distance, exact), (None, False))
+                else:
+                    self.assertEqual(distance, len(line))
+                    self.assertMateLine(fen, line)
+
+
+if __name__ == "__main__":
+    unittest.main()